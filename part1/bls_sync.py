@@ -1,10 +1,20 @@
 import os
+import re
 import time
 import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
 from urllib.parse import urljoin
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import xxhash
+import orjson
 import boto3
-from bs4 import BeautifulSoup
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from dotenv import load_dotenv
 
 #Since we wont be hardcoding anything here we will be taking all the requirements from .env
@@ -15,6 +25,115 @@ if os.path.exists(env_path):
 else:
     load_dotenv(override=True)
 
+#The sync is pure network I/O so a small thread pool gives us near linear speedup, the semaphore keeps us polite towards the BLS server
+#BLS_MAX_WORKERS in the .env tunes how many files are in flight at once, the connection pool grows with it so no worker waits for a socket
+MAX_WORKERS = int(os.getenv("BLS_MAX_WORKERS", "16"))
+HTTP_POOL_SIZE = max(32, MAX_WORKERS)
+
+#One keep-alive session per process so every file reuses the same TCP/TLS connections to download.bls.gov instead of handshaking again
+@lru_cache(maxsize=None)
+def get_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], respect_retry_after_header=True)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+#Token bucket shared by all workers, it replaces the fixed sleeps: requests go out back to back while tokens last and are only spaced out once the burst is spent
+#BLS_RATE_LIMIT is in requests per second, 429/503 answers are still retried by urllib3 which honours the server's Retry-After
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError(f"BLS_RATE_LIMIT must be a positive number of requests per second, got {rate}")
+        self.rate = rate
+        #A bucket that cannot hold one whole token would never hand one out, so rates below 1/s still allow a burst of one
+        self.capacity = max(1.0, capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+BLS_RATE = TokenBucket(float(os.getenv("BLS_RATE_LIMIT", "4")))
+
+#BLS serves an IIS style listing with upper case <A HREF="...">, hence the IGNORECASE
+HREF_PATTERN = re.compile(rb'<a\s[^>]*?href\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+#Files above the threshold go up as parallel multipart uploads, smaller ones still use a single PUT
+#Threshold and part size have to stay equal, S3ETag below rebuilds the multipart ETag from exactly that layout
+#8 part threads per upload keeps a few concurrent large files inside the 64 connection S3 pool
+MB = 1024 * 1024
+MULTIPART_CHUNK = 8 * MB
+UPLOAD_THREADS = 8
+TRANSFER_CFG = TransferConfig(multipart_threshold=MULTIPART_CHUNK, multipart_chunksize=MULTIPART_CHUNK, max_concurrency=UPLOAD_THREADS, use_threads=True)
+#Downloads are spooled in memory up to this size and spill to a temp file beyond it
+SPOOL_MAX = MULTIPART_CHUNK
+DOWNLOAD_CHUNK = 1024 * 1024
+#Every worker can run a multipart upload with several threads of its own, so the S3 pool is sized well above MAX_WORKERS and kept alive between calls
+S3_CLIENT_CFG = Config(
+    max_pool_connections=64,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    tcp_keepalive=True,
+    s3={'addressing_style': 'virtual'}
+)
+#Side index of {file name: xxh3 digest} kept next to the data, since multipart ETags are not a content hash we can compare against
+MANIFEST_NAME = '.manifest.json'
+#The ingestion Lambda writes its annual cube and Parquet partitions under the same prefix, they are not BLS files and must never be deleted as stale
+ANNUAL_CUBE_NAME = 'bls-annual.parquet'
+PARTITION_DIR = 'bls-parquet'
+DERIVED_NAMES = frozenset((MANIFEST_NAME, ANNUAL_CUBE_NAME, PARTITION_DIR))
+DELETE_BATCH = 1000
+
+#MD5 only ever serves as an ETag checksum here, flagging it as non-security skips the FIPS guard on OpenSSL 3 builds
+md5 = partial(hashlib.md5, usedforsecurity=False)
+
+#S3 only uses the plain MD5 as ETag for single part uploads, multipart ETags are the MD5 of the part digests plus the part count
+#This builds the same ETag chunk by chunk while the file is streamed so we never need the whole file in memory
+class S3ETag:
+    def __init__(self):
+        self.part = md5()
+        self.part_size = 0
+        self.part_digests = []
+
+    def update(self, chunk):
+        view = memoryview(chunk)
+        while view:
+            take = min(len(view), MULTIPART_CHUNK - self.part_size)
+            self.part.update(view[:take])
+            self.part_size += take
+            view = view[take:]
+            if self.part_size == MULTIPART_CHUNK:
+                self.part_digests.append(self.part.digest())
+                self.part = md5()
+                self.part_size = 0
+
+    def hexdigest(self):
+        if not self.part_digests:
+            return self.part.hexdigest()
+        digests = self.part_digests + ([self.part.digest()] if self.part_size else [])
+        return f"{md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
 def sync_bls_to_s3():
     bls_url = os.getenv("BLS_BASE_URL")
     s3_bucket = os.getenv("AWS_BUCKET_NAME")
@@ -33,34 +152,77 @@ def sync_bls_to_s3():
         's3',
         aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
         aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=region
+        region_name=region,
+        config=S3_CLIENT_CFG
     )
  #Taking everything into measure here that is how we check for deduplication   
     stats = {'uploaded': 0, 'failed': 0, 'skipped': 0, 'deleted': 0}
     
     def get_existing_files():
+        #Every key starts with the prefix we listed, slicing it off is cheaper (and safer) than str.replace
+        prefix_len = len(s3_prefix)
         existing = {}
         paginator = s3_client.get_paginator('list_objects_v2')
-        for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix):
+        for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix, Delimiter='/', FetchOwner=False):
             if 'Contents' in page:
                 for obj in page['Contents']:
-                    fname = obj['Key'].replace(s3_prefix, '').lstrip('/')
-                    existing[fname] = obj['ETag'].strip('"')
+                    fname = obj['Key'][prefix_len:].lstrip('/')
+                    if fname not in DERIVED_NAMES:
+                        existing[fname] = {'key': obj['Key'], 'etag': obj['ETag'].strip('"'), 'size': obj['Size']}
         return existing
 
-    def file_needs_upload(filename, content, existing_files):
-        norm_name = filename.lstrip('/')
-        if norm_name not in existing_files:
+    def load_manifest():
+        try:
+            resp = s3_client.get_object(Bucket=s3_bucket, Key=manifest_key)
+            return orjson.loads(resp['Body'].read()), resp['ETag']
+        except s3_client.exceptions.NoSuchKey:
+            return None, None
+
+    #Conditional PUT against the version we loaded, if another sync wrote the manifest in between S3 refuses instead of us overwriting it
+    def save_manifest(entries, etag):
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        s3_client.put_object(Bucket=s3_bucket, Key=manifest_key, Body=orjson.dumps(entries, option=orjson.OPT_SORT_KEYS), ContentType='application/json', **condition)
+
+    #Two tiers: the size is free to compare and settles most changed files, the digest only decides when the sizes tie
+    def file_needs_upload(filename, entry, etag):
+        #A manifest entry says nothing once its object is gone from the bucket, so missing objects are always uploaded
+        if filename not in existing_files:
+            return True
+        if filename in manifest:
+            known = manifest[filename]
+            if 'size' in known and known['size'] != entry['size']:
+                return True
+            return known['xxh3'] != entry['xxh3']
+        known = existing_files[filename] #Objects uploaded before the manifest existed only have their ETag to compare against
+        if known['size'] != entry['size']:
+            return True
+        if etag is not None and known['etag'] == etag.hexdigest():
+            return False
+        #A multipart ETag depends on the part size it was uploaded with, the xxh3 we tag every upload with does not
+        if '-' in known['etag']:
+            head = s3_client.head_object(Bucket=s3_bucket, Key=known['key'])
+            return head.get('Metadata', {}).get('xxh3') != entry['xxh3']
+        return True
+
+    def size_may_match(resp, size):
+        length = resp.headers.get('Content-Length')
+        if length is None or 'Content-Encoding' in resp.headers:
             return True
-        return existing_files[norm_name] != hashlib.md5(content).hexdigest() #There are few ways of checking if the file exists the method I chose is the most lightweight one that is add hash values which would act as keys
+        return int(length) == size
 #The print statements have been refined or added using Claude for better readability or better communication of code.
     print("Checking existing files in S3...")
+    manifest_key = f"{s3_prefix}{MANIFEST_NAME}"
+    manifest, manifest_etag = load_manifest()
+    #This is the only listing of the run, the same result tells us what to delete at the end
     existing_files = get_existing_files()
+    if manifest is None:
+        print("No manifest found, comparing against S3 ETags instead")
+        manifest = {}
     print(f"Found {len(existing_files)} existing files")
     
     print(f"Fetching BLS directory: {bls_url}")
     try:
-        session = requests.Session()
+        session = get_http_session()
         session.headers.update(headers)
         response = session.get(bls_url, timeout=30)
         if response.status_code == 403:
@@ -70,58 +232,120 @@ def sync_bls_to_s3():
     except Exception as e:
         print(f"Error fetching directory: {e}")
         return stats
-    #Used BeautfulSoup as the webscraper since it is a very lightweight scraping task
-    soup = BeautifulSoup(response.text, 'html.parser')
+    #The directory listing only matters for its links, so a compiled regex over the raw bytes is enough and no DOM gets built
     files = []
-    for link in soup.find_all('a'):
-        href = link.get('href', '')
-        if href and 'pr.' in href and href not in ['../', '/']:
+    for match in HREF_PATTERN.finditer(response.content):
+        href = match.group(1).decode('utf-8')
+        if 'pr.' in href:
             files.append({'name': href, 'url': urljoin(bls_url, href)})
             
     print(f"Found {len(files)} files in directory")
-    time.sleep(1)
-    
-    for file_info in files:
+
+    download_slots = threading.Semaphore(MAX_WORKERS)
+
+    def process_file(file_info):
         basename = os.path.basename(file_info['name'])
         s3_key = f"{s3_prefix}{basename}" if s3_prefix else basename
         
         try:
-            time.sleep(0.5)
-            resp = session.get(file_info['url'], timeout=60)
-            resp.raise_for_status()
-            content = resp.content
-            
-            if not file_needs_upload(basename, content, existing_files):
-                stats['skipped'] += 1
-                print(f"[SKIPPED FILE] {basename}")
-                continue
-            
-            print(f"Uploading {basename}...")
-            s3_client.put_object(Bucket=s3_bucket, Key=s3_key, Body=content)
-            stats['uploaded'] += 1
-            print(f"[OK] Uploaded {basename}")
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX) as buf:
+                hasher = xxhash.xxh3_128()
+                size = 0
+                etag = None
+                #BLS sends Last-Modified (and an ETag), so an unchanged file comes back as an empty 304 instead of the full body
+                #Only for objects still in the bucket, otherwise BLS would answer 304 for a file we no longer have
+                known = manifest.get(basename) if basename in existing_files else None
+                conditional = {}
+                if known and known.get('source_etag'):
+                    conditional['If-None-Match'] = known['source_etag']
+                if known and known.get('last_modified'):
+                    conditional['If-Modified-Since'] = known['last_modified']
+                with download_slots, BLS_RATE, session.get(file_info['url'], headers=conditional, stream=True, timeout=60) as resp:
+                    if resp.status_code == 304:
+                        print(f"[SKIPPED FILE] {basename} (not modified)")
+                        return 'skipped', basename, known
+                    resp.raise_for_status()
+                    last_modified = resp.headers.get('Last-Modified')
+                    source_etag = resp.headers.get('ETag')
+                    #MD5 is only worth computing for old objects missing from the manifest, and only if their size could still match
+                    legacy = existing_files.get(basename) if basename not in manifest else None
+                    if legacy and size_may_match(resp, legacy['size']):
+                        etag = S3ETag()
+                    for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                        hasher.update(chunk)
+                        if etag:
+                            etag.update(chunk)
+                        buf.write(chunk)
+                        size += len(chunk)
+                
+                entry = {'xxh3': hasher.hexdigest(), 'size': size}
+                if last_modified:
+                    entry['last_modified'] = last_modified
+                if source_etag:
+                    entry['source_etag'] = source_etag
+                if not file_needs_upload(basename, entry, etag):
+                    print(f"[SKIPPED FILE] {basename}")
+                    return 'skipped', basename, entry
+                
+                print(f"Uploading {basename}...")
+                buf.seek(0)
+                s3_client.upload_fileobj(buf, s3_bucket, s3_key, Config=TRANSFER_CFG, ExtraArgs={'Metadata': {'xxh3': entry['xxh3']}})
+                print(f"[OK] Uploaded {basename}")
+                return 'uploaded', basename, entry
             
         except Exception as e:
-            stats['failed'] += 1
             print(f"[FAILED FILE] {basename}: {e}")
+            return 'failed', basename, manifest.get(basename)
+
+    #DeleteObjects takes up to 1000 keys per request so stale files go in batches rather than one round trip each
+    def delete_files(keys):
+        deleted = failed = 0
+        for i in range(0, len(keys), DELETE_BATCH):
+            batch = keys[i:i + DELETE_BATCH]
+            try:
+                resp = s3_client.delete_objects(Bucket=s3_bucket, Delete={'Objects': [{'Key': k} for k in batch], 'Quiet': True})
+            except Exception as e:
+                print(f"[FAILED TASK] Delete batch of {len(batch)}: {e}")
+                failed += len(batch)
+                continue
+            errors = resp.get('Errors', [])
+            for err in errors:
+                print(f"[FAILED TASK] Delete {err['Key']}: {err.get('Message')}")
+            deleted += len(batch) - len(errors)
+            failed += len(errors)
+        return deleted, failed
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(process_file, file_info) for file_info in files]
+        new_manifest = {}
+        #Every listed object starts out unseen, whatever no BLS file claims by the end is stale
+        unseen = dict(existing_files)
+        for future in as_completed(futures):
+            status, basename, entry = future.result()
+            stats[status] += 1
+            unseen.pop(basename, None)
+            if entry:
+                new_manifest[basename] = entry
 
     print("Checking for deletions...")
-    current_files = {os.path.basename(f['name']) for f in files}
-    paginator = s3_client.get_paginator('list_objects_v2')
-    
-    for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix):
-        if 'Contents' in page:
-            for obj in page['Contents']:
-                key = obj['Key']
-                norm_name = key.replace(s3_prefix, '').lstrip('/')
-                
-                if norm_name not in current_files:
-                    try:
-                        print(f"[DELETED FILE] {norm_name}")
-                        s3_client.delete_object(Bucket=s3_bucket, Key=key)
-                        stats['deleted'] += 1
-                    except Exception as e:
-                        print(f"[FAILED TASK] Delete {norm_name}: {e}")
+    to_delete = []
+    for name, known in unseen.items():
+        print(f"[DELETED FILE] {name}")
+        to_delete.append(known['key'])
+    deleted, failed = delete_files(to_delete)
+    stats['deleted'] += deleted
+    stats['failed'] += failed
+
+    if new_manifest != manifest:
+        try:
+            save_manifest(new_manifest, manifest_etag)
+        except s3_client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'PreconditionFailed':
+                print("[SKIPPED TASK] Manifest was changed by another sync, keeping its version")
+            else:
+                print(f"[FAILED TASK] Manifest update: {e}")
+        except Exception as e:
+            print(f"[FAILED TASK] Manifest update: {e}")
 
     print(f"Sync complete: {stats}")
     return stats
@@ -1,8 +1,11 @@
 import os
-import json
+import base64
 import hashlib
 import requests
+import xxhash
+import orjson
 import boto3
+from botocore.config import Config
 from dotenv import load_dotenv
 
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,6 +14,8 @@ if os.path.exists(env_path):
     load_dotenv(dotenv_path=env_path, override=True)
 else:
     load_dotenv(override=True)
+
+S3_CLIENT_CFG = Config(max_pool_connections=32, retries={'max_attempts': 5, 'mode': 'adaptive'})
 #Again no hard coded variable names everything can be tweaked directly from the commonly shared .env file
 def ingest_population_data():
     api_url = os.getenv("POPULATION_API_URL")
@@ -26,40 +31,66 @@ def ingest_population_data():
         's3',
         aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
         aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=region
+        region_name=region,
+        config=S3_CLIENT_CFG
     )
 
+    filename = "population_data.json"
+    s3_key = f"{s3_prefix}{filename}" if s3_prefix else filename
+
+    #The stored copy remembers the API's ETag and Last-Modified, so an unchanged dataset comes back as an empty 304
+    try:
+        existing = s3_client.head_object(Bucket=s3_bucket, Key=s3_key)
+    except Exception:
+        existing = None #Not uploaded yet (or not readable), either way we fetch the full payload
+    stored = existing.get('Metadata', {}) if existing else {}
+    headers = {'User-Agent': f"DataBot ({from_email})"}
+    if stored.get('source-etag'):
+        headers['If-None-Match'] = stored['source-etag']
+    if stored.get('source-last-modified'):
+        headers['If-Modified-Since'] = stored['source-last-modified']
+
     print(f"Fetching: {api_url}")
     try:
-        resp = requests.get(api_url, headers={'User-Agent': f"DataBot ({from_email})"}, timeout=30)
+        resp = requests.get(api_url, headers=headers, timeout=30)
+        if resp.status_code == 304:
+            print(f" Not modified upstream: {filename}")
+            return {'status': 'SKIPPED', 'hash': stored.get('xxh3')}
         resp.raise_for_status()
-        data = resp.json()
+        json_bytes = resp.content
+        orjson.loads(json_bytes) #Only parsed to make sure the payload is valid JSON before we store it as is
     except Exception as e:
         print(f"API Request failed: {e}")
         return {'status': 'ERROR', 'message': str(e)}
 
-    # Serialize with sort_keys=True to ensure consistent hashing and also to check for duplication, again going with the lighweight hashing logic to avoid duplicates
-    json_bytes = json.dumps(data, sort_keys=True).encode('utf-8')
-    new_hash = hashlib.md5(json_bytes).hexdigest()
-    
-    filename = "population_data.json"
-    s3_key = f"{s3_prefix}{filename}" if s3_prefix else filename
+    #The API sends byte identical responses when nothing changed, so hashing the raw body is enough to check for duplication, no need to re-serialize it
+    new_hash = xxhash.xxh3_128(json_bytes).hexdigest()
+    #One MD5 pass serves both the legacy ETag comparison and the ContentMD5 header so S3 checks the body on its side
+    md5_digest = hashlib.md5(json_bytes, usedforsecurity=False).digest()
 
-    try:
-        existing = s3_client.head_object(Bucket=s3_bucket, Key=s3_key)
-        if existing['ETag'].strip('"') == new_hash:
+    if existing:
+        stored_hash = stored.get('xxh3')
+        #Objects uploaded before we started tagging them with the xxh3 digest fall back to the MD5 ETag
+        if stored_hash == new_hash or (stored_hash is None and existing['ETag'].strip('"') == md5_digest.hex()):
             print(f" Data identical: {filename}")
             return {'status': 'SKIPPED', 'hash': new_hash}
-    except Exception:
-        pass #It has checked all the possible situations that is if file exists or if the file is not present, since both are cleared we upload
+    #It has checked all the possible situations that is if file exists or if the file is not present, since both are cleared we upload
+    metadata = {'xxh3': new_hash}
+    if resp.headers.get('ETag'):
+        metadata['source-etag'] = resp.headers['ETag']
+    if resp.headers.get('Last-Modified'):
+        metadata['source-last-modified'] = resp.headers['Last-Modified']
 #Again the print statements are refined or added taking assistance from claude to beautify the code.
     print(f"Uploading to s3://{s3_bucket}/{s3_key}")#Routing step to understand where the file is landing in the S3 bucket.
     try:
+        #The payload is a few KB so a single put_object is enough, and unlike upload_fileobj it accepts ContentMD5
         s3_client.put_object(
             Bucket=s3_bucket,
             Key=s3_key,
             Body=json_bytes,
-            ContentType='application/json'
+            ContentMD5=base64.b64encode(md5_digest).decode(),
+            ContentType='application/json',
+            Metadata=metadata
         )
         print("Upload complete")
         return {'status': 'UPDATED', 'hash': new_hash}
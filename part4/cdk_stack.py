@@ -39,6 +39,8 @@ class RearcQuestStack(Stack):
             handler="ingestion_handler.lambda_handler",
             code=_lambda.Code.from_asset("lambda/ingestion"),
             timeout=Duration.minutes(5),
+            memory_size=1024,
+            architecture=_lambda.Architecture.ARM_64,
             environment={
                 "BUCKET_NAME": bucket.bucket_name
             }
@@ -60,6 +62,8 @@ class RearcQuestStack(Stack):
             handler="analytics_handler.lambda_handler",
             code=_lambda.Code.from_asset("lambda/analytics"),
             timeout=Duration.minutes(5),
+            memory_size=1024,
+            architecture=_lambda.Architecture.ARM_64,
             environment={
                 "BUCKET_NAME": bucket.bucket_name
             }
@@ -67,10 +71,13 @@ class RearcQuestStack(Stack):
 
         bucket.grant_read(analytics_lambda)
 # Finally the collab of s3 and sqs notification which is mentioned in the task
-        bucket.add_event_notification(
-            s3.EventType.OBJECT_CREATED,
-            s3n.SqsDestination(queue)
-        )
+#Only the population file and the annual cube (written last by each BLS rebuild) notify, the raw files, partitions and manifest would otherwise start one analytics run per PUT
+        for suffix in ("population_data.json", "bls-annual.parquet"):
+            bucket.add_event_notification(
+                s3.EventType.OBJECT_CREATED,
+                s3n.SqsDestination(queue),
+                s3.NotificationKeyFilter(suffix=suffix)
+            )
 
 
         analytics_lambda.add_event_source(
@@ -1,20 +1,224 @@
 
 import os
+import re
 import json
+import io
 import time
+import base64
 import hashlib
 import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
+from itertools import islice
 from urllib.parse import urljoin
 import requests
+import xxhash
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import pandas as pd
 import boto3
-from bs4 import BeautifulSoup
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
 #Tracking logging info to keep track of the work
+# Per file lines are logged at DEBUG, INFO only carries the per run summaries (LOG_LEVEL=DEBUG brings them back)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
 # Initialize S3 client also to check for IAM permissions here
-s3_client = boto3.client('s3')
+# Each sync worker can run a multipart upload with threads of its own, so the pool is sized well above MAX_WORKERS
+s3_client = boto3.client('s3', config=Config(
+    max_pool_connections=64,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    tcp_keepalive=True,
+    s3={'addressing_style': 'virtual'}
+))
+
+# Configuration from environment variables, resolved once per container
+S3_BUCKET = os.environ.get('S3_BUCKET_NAME')
+S3_PREFIX = os.environ.get('S3_BUCKET_PREFIX', '')
+BLS_BASE_URL = os.environ.get('BLS_BASE_URL')
+POPULATION_API_URL = os.environ.get('POPULATION_API_URL')
+CONTACT_EMAIL = os.environ.get('CONTACT_EMAIL', 'data@example.com')
+
+# Links in the BLS directory listing, which is served with upper case <A HREF="...">
+HREF_PATTERN = re.compile(rb'<a\s[^>]*?href\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+# Files above the threshold are uploaded as parallel multipart uploads
+# Threshold and part size stay equal since S3ETag rebuilds the multipart ETag from exactly that layout
+MB = 1024 * 1024
+MULTIPART_CHUNK = 8 * MB
+UPLOAD_THREADS = 8
+TRANSFER_CFG = TransferConfig(multipart_threshold=MULTIPART_CHUNK, multipart_chunksize=MULTIPART_CHUNK, max_concurrency=UPLOAD_THREADS, use_threads=True)
+
+# Downloads are spooled in memory up to this size and spill to /tmp beyond it
+SPOOL_MAX = MULTIPART_CHUNK
+DOWNLOAD_CHUNK = 1024 * 1024
+
+# Side index of {file name: xxh3 digest}, multipart ETags are not a content hash we can compare against
+MANIFEST_NAME = '.manifest.json'
+
+# Manifests seen by earlier invocations in this container, keyed by (bucket, key)
+_MANIFEST_CACHE = {}
+
+# Per series yearly sums for Task B, rebuilt here once a day so the analytics Lambda can skip the groupby
+ANNUAL_CUBE_NAME = 'bls-annual.parquet'
+
+# BLS rows as Parquet, one file per period, so Task C only opens the period it asks for
+PARTITION_DIR = 'bls-parquet'
+PARTITION_ROW_GROUP = 64 * 1024
+
+# Objects (or top level folders) we write under the BLS prefix ourselves, these are never part of the mirror
+DERIVED_NAMES = frozenset((MANIFEST_NAME, ANNUAL_CUBE_NAME, PARTITION_DIR))
+
+# BLS files are tab separated with padded cells
+BLS_PARSE_OPTIONS = pacsv.ParseOptions(delimiter='\t', invalid_row_handler=lambda row: 'skip')
+NUMERIC_PATTERN = r'^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$'
+
+# S3 DeleteObjects limit per request
+DELETE_BATCH = 1000
+
+# Downloads and uploads are network bound, so a bounded thread pool runs them concurrently
+# BLS_MAX_WORKERS tunes how many files are in flight, the connection pool grows with it
+MAX_WORKERS = int(os.environ.get('BLS_MAX_WORKERS', '16'))
+HTTP_POOL_SIZE = max(32, MAX_WORKERS)
+
+
+# MD5 is only an ETag checksum here, not a security primitive, which also keeps it usable on FIPS enabled OpenSSL builds
+md5 = partial(hashlib.md5, usedforsecurity=False)
+
+
+def batched(items, size):
+    # Same as itertools.batched (3.12+), kept local so the handler still runs on older local Pythons
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket used to pace requests to BLS.
+
+    Requests go out back to back while tokens last and are spaced at
+    `rate` per second once the burst is spent.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError(f"BLS_RATE_LIMIT must be a positive number of requests per second, got {rate}")
+        self.rate = rate
+        # A bucket that cannot hold one whole token would never hand one out, so rates below 1/s still allow a burst of one
+        self.capacity = max(1.0, capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# Shared by every sync worker, 429/503 answers are retried by urllib3 which honours Retry-After
+BLS_RATE = TokenBucket(float(os.environ.get('BLS_RATE_LIMIT', '4')))
+
+
+@lru_cache(maxsize=None)
+def get_http_session():
+    # Cached at module scope so warm invocations keep their keep-alive connections to BLS
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], respect_retry_after_header=True)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class S3ETag:
+    """
+    Incremental S3 ETag, fed chunk by chunk while a file is streamed.
+
+    Single part uploads get the plain MD5 as ETag, multipart ones the MD5
+    of the part digests plus the part count.
+    """
+
+    def __init__(self):
+        self.part = md5()
+        self.part_size = 0
+        self.part_digests = []
+
+    def update(self, chunk: bytes):
+        view = memoryview(chunk)
+        while view:
+            take = min(len(view), MULTIPART_CHUNK - self.part_size)
+            self.part.update(view[:take])
+            self.part_size += take
+            view = view[take:]
+            if self.part_size == MULTIPART_CHUNK:
+                self.part_digests.append(self.part.digest())
+                self.part = md5()
+                self.part_size = 0
+
+    def hexdigest(self) -> str:
+        if not self.part_digests:
+            return self.part.hexdigest()
+        digests = self.part_digests + ([self.part.digest()] if self.part_size else [])
+        return f"{md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+def delete_keys(s3_bucket: str, keys: list):
+    """
+    Delete keys with DeleteObjects, up to 1000 per request instead of one call each
+    
+    Args:
+        s3_bucket: S3 bucket name
+        keys: Full object keys to delete
+    
+    Returns:
+        tuple: (deleted, failed) counts
+    """
+    deleted = failed = 0
+    for batch in batched(keys, DELETE_BATCH):
+        try:
+            resp = s3_client.delete_objects(
+                Bucket=s3_bucket,
+                Delete={'Objects': [{'Key': k} for k in batch], 'Quiet': True}
+            )
+        except Exception as e:
+            logger.error("[FAILED DELETE] batch of %s: %s", len(batch), e)
+            failed += len(batch)
+            continue
+        errors = resp.get('Errors', [])
+        for err in errors:
+            logger.error("[FAILED DELETE] %s: %s", err['Key'], err.get('Message'))
+        deleted += len(batch) - len(errors)
+        failed += len(errors)
+    return deleted, failed
+
 
 def sync_bls_to_s3(s3_bucket: str, s3_prefix: str, bls_url: str, from_email: str):
 
@@ -27,28 +231,93 @@ def sync_bls_to_s3(s3_bucket: str, s3_prefix: str, bls_url: str, from_email: str
     stats = {'uploaded': 0, 'failed': 0, 'skipped': 0, 'deleted': 0}
     
     def get_existing_files():
+        # Every key starts with the listed prefix, so it is sliced off rather than str.replace'd
+        prefix_len = len(s3_prefix)
         existing = {}
         paginator = s3_client.get_paginator('list_objects_v2')
-        for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix):
+        for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix, Delimiter='/', FetchOwner=False):
             if 'Contents' in page:
                 for obj in page['Contents']:
-                    fname = obj['Key'].replace(s3_prefix, '').lstrip('/')
-                    existing[fname] = obj['ETag'].strip('"')
+                    fname = obj['Key'][prefix_len:].lstrip('/')
+                    if fname not in DERIVED_NAMES:
+                        existing[fname] = {'key': obj['Key'], 'etag': obj['ETag'].strip('"'), 'size': obj['Size']}
         return existing
 
-    def file_needs_upload(filename, content, existing_files):
-        norm_name = filename.lstrip('/')
-        if norm_name not in existing_files:
+    def load_manifest():
+        # A warm container revalidates its copy with IfNoneMatch instead of downloading the manifest again
+        cached = _MANIFEST_CACHE.get((s3_bucket, manifest_key))
+        try:
+            if cached:
+                resp = s3_client.get_object(Bucket=s3_bucket, Key=manifest_key, IfNoneMatch=cached['etag'])
+            else:
+                resp = s3_client.get_object(Bucket=s3_bucket, Key=manifest_key)
+        except s3_client.exceptions.NoSuchKey:
+            _MANIFEST_CACHE.pop((s3_bucket, manifest_key), None)
+            return None
+        except s3_client.exceptions.ClientError as e:
+            if cached and e.response.get('Error', {}).get('Code') == '304':
+                logger.info("Manifest unchanged since the last warm invocation")
+                return cached['entries']
+            raise
+        entries = orjson.loads(resp['Body'].read())
+        _MANIFEST_CACHE[(s3_bucket, manifest_key)] = {'etag': resp['ETag'], 'entries': entries}
+        return entries
+
+    def save_manifest(entries):
+        # Conditional write against the version we loaded, so an overlapping sync cannot be silently overwritten
+        loaded = _MANIFEST_CACHE.get((s3_bucket, manifest_key))
+        condition = {'IfMatch': loaded['etag']} if loaded else {'IfNoneMatch': '*'}
+        resp = s3_client.put_object(
+            Bucket=s3_bucket,
+            Key=manifest_key,
+            Body=orjson.dumps(entries, option=orjson.OPT_SORT_KEYS),
+            ContentType='application/json',
+            **condition
+        )
+        _MANIFEST_CACHE[(s3_bucket, manifest_key)] = {'etag': resp['ETag'], 'entries': entries}
+
+    def file_needs_upload(filename, entry, etag):
+        # A manifest entry is meaningless once its object is gone from the bucket, so missing objects are always uploaded
+        if filename not in existing_files:
             return True
-        return existing_files[norm_name] != hashlib.md5(content).hexdigest()
+        # Two tiers: the size is free to compare and settles most changed files, the digest only decides when sizes tie
+        if filename in manifest:
+            known = manifest[filename]
+            if 'size' in known and known['size'] != entry['size']:
+                return True
+            return known['xxh3'] != entry['xxh3']
+        # Objects uploaded before the manifest existed only have their ETag to compare against
+        known = existing_files[filename]
+        if known['size'] != entry['size']:
+            return True
+        if etag is not None and known['etag'] == etag.hexdigest():
+            return False
+        # A multipart ETag depends on the part size it was uploaded with, the xxh3 metadata on every upload does not
+        if '-' in known['etag']:
+            head = s3_client.head_object(Bucket=s3_bucket, Key=known['key'])
+            return head.get('Metadata', {}).get('xxh3') != entry['xxh3']
+        return True
+
+    def size_may_match(resp, size):
+        # Content-Length is the compressed size when the server gzips the body
+        length = resp.headers.get('Content-Length')
+        if length is None or 'Content-Encoding' in resp.headers:
+            return True
+        return int(length) == size
 
     logger.info("Checking existing files in S3...")
+    manifest_key = f"{s3_prefix}{MANIFEST_NAME}"
+    manifest = load_manifest()
+    # The one listing of the run, it also drives the deletion pass at the end
     existing_files = get_existing_files()
-    logger.info(f"Found {len(existing_files)} existing files")
+    if manifest is None:
+        logger.info("No manifest found - comparing against S3 ETags instead")
+        manifest = {}
+    logger.info("Found %s existing files", len(existing_files))
     
-    logger.info(f"Fetching BLS directory: {bls_url}")
+    logger.info("Fetching BLS directory: %s", bls_url)
     try:
-        session = requests.Session()
+        session = get_http_session()
         session.headers.update(headers)
         response = session.get(bls_url, timeout=30)
         if response.status_code == 403:
@@ -56,113 +325,316 @@ def sync_bls_to_s3(s3_bucket: str, s3_prefix: str, bls_url: str, from_email: str
             response = session.get(bls_url, headers=headers, timeout=30)
         response.raise_for_status()
     except Exception as e:
-        logger.error(f"Error fetching directory: {e}")
+        logger.error("Error fetching directory: %s", e)
         return stats
     
-    soup = BeautifulSoup(response.text, 'html.parser')
+    # Only the links matter, so a compiled regex over the raw bytes replaces building a DOM
     files = []
-    for link in soup.find_all('a'):
-        href = link.get('href', '')
-        if href and 'pr.' in href and href not in ['../', '/']:
+    for match in HREF_PATTERN.finditer(response.content):
+        href = match.group(1).decode('utf-8')
+        if 'pr.' in href:
             files.append({'name': href, 'url': urljoin(bls_url, href)})
             
-    logger.info(f"Found {len(files)} files in directory")
-    time.sleep(1)
-    
-    for file_info in files:
+    logger.info("Found %s files in directory", len(files))
+
+    download_slots = threading.Semaphore(MAX_WORKERS)
+
+    def process_file(file_info):
         basename = os.path.basename(file_info['name'])
         s3_key = f"{s3_prefix}{basename}" if s3_prefix else basename
         
         try:
-            time.sleep(0.5)
-            resp = session.get(file_info['url'], timeout=60)
-            resp.raise_for_status()
-            content = resp.content
-            
-            if not file_needs_upload(basename, content, existing_files):
-                stats['skipped'] += 1
-                logger.info(f"[SKIPPED] {basename}")
-                continue
-            
-            logger.info(f"Uploading {basename}...")
-            s3_client.put_object(Bucket=s3_bucket, Key=s3_key, Body=content)
-            stats['uploaded'] += 1
-            logger.info(f"[OK] Uploaded {basename}")
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX) as buf:
+                hasher = xxhash.xxh3_128()
+                size = 0
+                etag = None
+                # BLS sends Last-Modified (and an ETag), so an unchanged file comes back as an empty 304 instead of the full body
+                # Only trusted while the object is still in the bucket, otherwise BLS would answer 304 for a file we lost
+                known = manifest.get(basename) if basename in existing_files else None
+                conditional = {}
+                if known and known.get('source_etag'):
+                    conditional['If-None-Match'] = known['source_etag']
+                if known and known.get('last_modified'):
+                    conditional['If-Modified-Since'] = known['last_modified']
+                with download_slots, BLS_RATE, session.get(file_info['url'], headers=conditional, stream=True, timeout=60) as resp:
+                    if resp.status_code == 304:
+                        logger.debug("[SKIPPED] %s (not modified)", basename)
+                        return 'skipped', basename, known
+                    resp.raise_for_status()
+                    last_modified = resp.headers.get('Last-Modified')
+                    source_etag = resp.headers.get('ETag')
+                    # MD5 is only worth computing for old objects missing from the manifest, and only if their size could still match
+                    legacy = existing_files.get(basename) if basename not in manifest else None
+                    if legacy and size_may_match(resp, legacy['size']):
+                        etag = S3ETag()
+                    for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                        hasher.update(chunk)
+                        if etag:
+                            etag.update(chunk)
+                        buf.write(chunk)
+                        size += len(chunk)
+                
+                entry = {'xxh3': hasher.hexdigest(), 'size': size}
+                if last_modified:
+                    entry['last_modified'] = last_modified
+                if source_etag:
+                    entry['source_etag'] = source_etag
+                if not file_needs_upload(basename, entry, etag):
+                    logger.debug("[SKIPPED] %s", basename)
+                    return 'skipped', basename, entry
+                
+                logger.debug("Uploading %s...", basename)
+                buf.seek(0)
+                s3_client.upload_fileobj(
+                    buf,
+                    s3_bucket,
+                    s3_key,
+                    Config=TRANSFER_CFG,
+                    ExtraArgs={'Metadata': {'xxh3': entry['xxh3']}}
+                )
+                logger.debug("[OK] Uploaded %s", basename)
+                return 'uploaded', basename, entry
             
         except Exception as e:
-            stats['failed'] += 1
-            logger.error(f"[FAILED] {basename}: {e}")
+            logger.error("[FAILED] %s: %s", basename, e)
+            return 'failed', basename, manifest.get(basename)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(process_file, file_info) for file_info in files]
+        new_manifest = {}
+        # Every listed object starts out unseen, whatever no BLS file claims by the end is stale
+        unseen = dict(existing_files)
+        for future in as_completed(futures):
+            status, basename, entry = future.result()
+            stats[status] += 1
+            unseen.pop(basename, None)
+            if entry:
+                new_manifest[basename] = entry
 
     logger.info("Checking for deletions...")
-    current_files = {os.path.basename(f['name']) for f in files}
+    to_delete = []
+    for name, known in unseen.items():
+        logger.info("[DELETED] %s", name)
+        to_delete.append(known['key'])
+    deleted, failed = delete_keys(s3_bucket, to_delete)
+    stats['deleted'] += deleted
+    stats['failed'] += failed
+
+    if new_manifest != manifest:
+        try:
+            save_manifest(new_manifest)
+        except s3_client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'PreconditionFailed':
+                logger.error("[FAILED] Manifest update: %s", e)
+            else:
+                # The other sync's manifest stays, the next run reconciles it against the bucket
+                _MANIFEST_CACHE.pop((s3_bucket, manifest_key), None)
+                logger.warning("Manifest was changed by another sync - keeping its version")
+        except Exception as e:
+            logger.error("[FAILED] Manifest update: %s", e)
+
+    logger.info("BLS sync complete: %s", stats)
+    return stats
+
+
+def read_bls_table(body: bytes) -> pa.Table:
+    # Every column is read as text, keyed on the raw (padded) header names, then the names are stripped
+    header = body[:body.find(b'\n')].decode('utf-8').rstrip('\r').split('\t')
+    convert_options = pacsv.ConvertOptions(
+        column_types={name: pa.string() for name in header},
+        strings_can_be_null=True
+    )
+    table = pacsv.read_csv(io.BytesIO(body), parse_options=BLS_PARSE_OPTIONS, convert_options=convert_options)
+    return table.rename_columns([name.strip() for name in table.column_names])
+
+
+def coerce_numeric(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    # Arrow equivalent of pd.to_numeric(errors='coerce')
+    trimmed = pc.utf8_trim_whitespace(column)
+    is_number = pc.match_substring_regex(trimmed, NUMERIC_PATTERN)
+    return pc.cast(pc.if_else(is_number, trimmed, None), pa.float64())
+
+
+def current_manifest_etag(s3_bucket: str, s3_prefix: str):
+    try:
+        return s3_client.head_object(Bucket=s3_bucket, Key=f"{s3_prefix}{MANIFEST_NAME}")['ETag'].strip('"')
+    except s3_client.exceptions.ClientError:
+        return None
+
+
+def derived_datasets_current(s3_bucket: str, s3_prefix: str, manifest_etag: str) -> bool:
+    # Every derived object is stamped with the manifest ETag it was built from, any other stamp predates the raw files
+    if manifest_etag is None:
+        return False
+    try:
+        cube = s3_client.head_object(Bucket=s3_bucket, Key=f"{s3_prefix}{ANNUAL_CUBE_NAME}")
+    except s3_client.exceptions.ClientError:
+        return False
+    if cube.get('Metadata', {}).get('manifest-etag') != manifest_etag:
+        return False
+    keys = []
     paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=s3_bucket, Prefix=f"{s3_prefix}{PARTITION_DIR}/"):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []))
+    if not keys:
+        return False
+    for key in keys:
+        head = s3_client.head_object(Bucket=s3_bucket, Key=key)
+        if head.get('Metadata', {}).get('manifest-etag') != manifest_etag:
+            return False
+    return True
+
+
+def load_bls_data(s3_bucket: str, s3_prefix: str):
     
-    for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix):
-        if 'Contents' in page:
-            for obj in page['Contents']:
-                key = obj['Key']
-                norm_name = key.replace(s3_prefix, '').lstrip('/')
-                
-                if norm_name not in current_files:
-                    try:
-                        logger.info(f"[DELETED] {norm_name}")
-                        s3_client.delete_object(Bucket=s3_bucket, Key=key)
-                        stats['deleted'] += 1
-                    except Exception as e:
-                        logger.error(f"[FAILED DELETE] {norm_name}: {e}")
-
-    logger.info(f"BLS sync complete: {stats}")
-    return stats
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_prefix, Delimiter='/', FetchOwner=False):
+        for obj in page.get('Contents', []):
+            if 'pr.data' in obj['Key']:
+                keys.append(obj['Key'])
+    
+    if not keys:
+        return None
+    
+    def load_table(key):
+        body = s3_client.get_object(Bucket=s3_bucket, Key=key)['Body'].read()
+        return read_bls_table(body).select(['series_id', 'year', 'period', 'value'])
+    
+    logger.info("Loading %s BLS files for the derived datasets", len(keys))
+    # executor.map keeps the key order, so rows stay in the same order the analytics Lambda reads them
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        table = pa.concat_tables(list(executor.map(load_table, keys)), promote_options='default')
+    
+    return pa.table({
+        'series_id': pc.utf8_trim_whitespace(table['series_id']),
+        'year': pc.cast(coerce_numeric(table['year']), pa.int16()),
+        'period': pc.utf8_trim_whitespace(table['period']),
+        'value': coerce_numeric(table['value'])
+    })
 
 
-def ingest_population_data(s3_bucket: str, api_url: str, from_email: str):
+def derived_metadata(manifest_etag: str) -> dict:
+    # Readers compare this stamp against the live manifest and fall back to the raw files when it is behind
+    return {'manifest-etag': manifest_etag} if manifest_etag else {}
 
-    s3_key = "population_data.json"
+
+def build_annual_cube(s3_bucket: str, s3_prefix: str, table: pa.Table, manifest_etag: str):
+
+    cube_key = f"{s3_prefix}{ANNUAL_CUBE_NAME}"
     
-    logger.info(f"Fetching population data from: {api_url}")
-    try:
-        resp = requests.get(
-            api_url, 
-            headers={'User-Agent': f"DataBot ({from_email})"}, 
-            timeout=30
-        )
-        resp.raise_for_status()
-        data = resp.json()
-    except Exception as e:
-        error_msg = f"API Request failed: {e}"
-        logger.error(error_msg)
-        return {'status': 'ERROR', 'message': error_msg}
+    # Summed by pandas like the raw Task B path, its compensated summation keeps the totals identical to the last digit where Arrow's would drift
+    # The groupby also drops rows with a missing series_id or year, and an all-missing group sums to 0
+    df = table.select(['series_id', 'year', 'value']).to_pandas(types_mapper={pa.int16(): pd.Int16Dtype()}.get)
+    df_annual = df.groupby(['series_id', 'year'], as_index=False, sort=False)['value'].sum()
+    annual = pa.Table.from_pandas(df_annual, preserve_index=False)
+    
+    buf = io.BytesIO()
+    pq.write_table(annual, buf)
+    s3_client.put_object(Bucket=s3_bucket, Key=cube_key, Body=buf.getvalue(), Metadata=derived_metadata(manifest_etag))
+    logger.info("Uploaded annual cube with %s rows to s3://%s/%s", format(annual.num_rows, ','), s3_bucket, cube_key)
+    return {'status': 'UPDATED', 'rows': annual.num_rows, 's3_key': cube_key}
+
+
+def build_period_partitions(s3_bucket: str, s3_prefix: str, table: pa.Table, manifest_etag: str):
 
-    # Serialize with sort_keys=True for consistent hashing
-    json_bytes = json.dumps(data, sort_keys=True).encode('utf-8')
-    new_hash = hashlib.md5(json_bytes).hexdigest()
-    logger.info(f"Calculated MD5 hash: {new_hash}")
+    partition_prefix = f"{s3_prefix}{PARTITION_DIR}/"
+    
+    written = []
+    for period in pc.unique(table['period']).drop_null().to_pylist():
+        # Sorted by series_id (stable, so file order is kept within a series) so row group statistics let readers skip most of the file
+        part = table.filter(pc.equal(table['period'], period)).sort_by('series_id')
+        key = f"{partition_prefix}period={period}/part-0.parquet"
+        buf = io.BytesIO()
+        pq.write_table(part, buf, row_group_size=PARTITION_ROW_GROUP)
+        s3_client.put_object(Bucket=s3_bucket, Key=key, Body=buf.getvalue(), Metadata=derived_metadata(manifest_etag))
+        written.append(key)
+    
+    # Periods that no longer appear in the data would otherwise linger from an earlier build
+    stale = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=s3_bucket, Prefix=partition_prefix):
+        stale.extend(obj['Key'] for obj in page.get('Contents', []) if obj['Key'] not in written)
+    removed, failed = delete_keys(s3_bucket, stale)
+    
+    logger.info("Uploaded %s period partitions to s3://%s/%s", len(written), s3_bucket, partition_prefix)
+    return {'status': 'UPDATED', 'partitions': len(written), 'removed': removed, 'failed': failed, 's3_prefix': partition_prefix}
 
 
+def ingest_population_data(s3_bucket: str, api_url: str, from_email: str):
+
+    s3_key = "population_data.json"
+    
+    # Look at the stored copy first, its metadata carries the upstream ETag and Last-Modified for a conditional GET
+    existing = None
     try:
         existing = s3_client.head_object(Bucket=s3_bucket, Key=s3_key)
-        existing_etag = existing['ETag'].strip('"')
-        if existing_etag == new_hash:
-            logger.info(f"Data identical: {s3_key}")
-            return {'status': 'SKIPPED', 'message': 'No changes detected', 'hash': new_hash}
-        logger.info(f"Data changed - new hash differs from existing")
     except s3_client.exceptions.ClientError as e:
         error_code = e.response.get('Error', {}).get('Code', '')
         if error_code == '404':
-            logger.info(f"File does not exist in S3 - will upload new file")
+            logger.info("File does not exist in S3 - will upload new file")
         else:
             error_msg = f"Error checking S3: {e}"
             logger.error(error_msg)
             return {'status': 'ERROR', 'message': error_msg}
+    stored = existing.get('Metadata', {}) if existing else {}
+    
+    headers = {'User-Agent': f"DataBot ({from_email})"}
+    if stored.get('source-etag'):
+        headers['If-None-Match'] = stored['source-etag']
+    if stored.get('source-last-modified'):
+        headers['If-Modified-Since'] = stored['source-last-modified']
+    
+    logger.info("Fetching population data from: %s", api_url)
+    try:
+        resp = requests.get(api_url, headers=headers, timeout=30)
+        if resp.status_code == 304:
+            logger.info("Population API reports no change since the stored copy: %s", s3_key)
+            return {'status': 'SKIPPED', 'message': 'Not modified upstream', 'hash': stored.get('xxh3')}
+        resp.raise_for_status()
+        json_bytes = resp.content
+        # Parsed only to make sure we never store a broken payload, the bytes are hashed and uploaded as served
+        orjson.loads(json_bytes)
+    except Exception as e:
+        error_msg = f"API Request failed: {e}"
+        logger.error(error_msg)
+        return {'status': 'ERROR', 'message': error_msg}
+
+    # The API returns byte identical responses when nothing changed, so the raw body is hashed directly
+    new_hash = xxhash.xxh3_128(json_bytes).hexdigest()
+    logger.info("Calculated xxh3 hash: %s", new_hash)
+    # A single MD5 pass feeds both the legacy ETag comparison and the ContentMD5 header on the upload
+    md5_digest = md5(json_bytes).digest()
+
+    if existing:
+        stored_hash = stored.get('xxh3')
+        if stored_hash is None:
+            # Uploaded before the xxh3 metadata existed, compare against the MD5 ETag instead
+            unchanged = existing['ETag'].strip('"') == md5_digest.hex()
+        else:
+            unchanged = stored_hash == new_hash
+        if unchanged:
+            logger.info("Data identical: %s", s3_key)
+            return {'status': 'SKIPPED', 'message': 'No changes detected', 'hash': new_hash}
+        logger.info("Data changed - new hash differs from existing")
+    
+    metadata = {'xxh3': new_hash}
+    if resp.headers.get('ETag'):
+        metadata['source-etag'] = resp.headers['ETag']
+    if resp.headers.get('Last-Modified'):
+        metadata['source-last-modified'] = resp.headers['Last-Modified']
 
     # Upload to S3
-    logger.info(f"Uploading to s3://{s3_bucket}/{s3_key}")
+    logger.info("Uploading to s3://%s/%s", s3_bucket, s3_key)
     try:
+        # The payload is small enough for one put_object, which (unlike upload_fileobj) lets S3 verify it against ContentMD5
         s3_client.put_object(
             Bucket=s3_bucket,
             Key=s3_key,
             Body=json_bytes,
-            ContentType='application/json'
+            ContentMD5=base64.b64encode(md5_digest).decode(),
+            ContentType='application/json',
+            Metadata=metadata
         )
         logger.info("Successfully uploaded population data to S3")
         return {
@@ -181,12 +653,11 @@ def lambda_handler(event, context):
 
     logger.info("Starting data ingestion pipeline")
     
-    # Get configuration from environment variables to keep the whole thing in track
-    s3_bucket = os.environ.get('S3_BUCKET_NAME')
-    s3_prefix = os.environ.get('S3_BUCKET_PREFIX', '')
-    bls_url = os.environ.get('BLS_BASE_URL')
-    population_api_url = os.environ.get('POPULATION_API_URL')
-    from_email = os.environ.get('CONTACT_EMAIL', 'data@example.com')
+    s3_bucket = S3_BUCKET
+    s3_prefix = S3_PREFIX
+    bls_url = BLS_BASE_URL
+    population_api_url = POPULATION_API_URL
+    from_email = CONTACT_EMAIL
     
     if not s3_bucket:
         return {
@@ -197,6 +668,8 @@ def lambda_handler(event, context):
     results = {
         'timestamp': context.aws_request_id if context else 'local',
         'bls_sync': None,
+        'bls_annual': None,
+        'bls_parquet': None,
         'population_ingest': None,
         'success': False
     }
@@ -206,22 +679,41 @@ def lambda_handler(event, context):
         try:
             logger.info("Starting BLS sync...")
             results['bls_sync'] = sync_bls_to_s3(s3_bucket, s3_prefix, bls_url, from_email)
-            logger.info(f"BLS sync completed: {results['bls_sync']}")
+            logger.info("BLS sync completed: %s", results['bls_sync'])
         except Exception as e:
-            logger.error(f"BLS sync failed: {e}", exc_info=True)
+            logger.error("BLS sync failed: %s", e, exc_info=True)
             results['bls_sync'] = {'status': 'ERROR', 'error': str(e)}
     else:
         logger.warning("BLS_BASE_URL not configured - skipping BLS sync")
         results['bls_sync'] = {'status': 'SKIPPED', 'message': 'BLS_BASE_URL not configured'}
     
+    # Rebuild the Task B cube and Task C partitions when the raw BLS files changed since they were last built
+    bls_stats = results['bls_sync']
+    try:
+        manifest_etag = current_manifest_etag(s3_bucket, s3_prefix)
+        if bls_stats.get('uploaded') or bls_stats.get('deleted') or not derived_datasets_current(s3_bucket, s3_prefix, manifest_etag):
+            table = load_bls_data(s3_bucket, s3_prefix)
+            if table is None:
+                logger.warning("No BLS data files found - skipping derived datasets")
+                results['bls_annual'] = results['bls_parquet'] = {'status': 'SKIPPED', 'message': 'No BLS data files found'}
+            else:
+                # The cube goes last, its PUT is the event that tells the analytics Lambda the derived data is ready
+                results['bls_parquet'] = build_period_partitions(s3_bucket, s3_prefix, table, manifest_etag)
+                results['bls_annual'] = build_annual_cube(s3_bucket, s3_prefix, table, manifest_etag)
+        else:
+            results['bls_annual'] = results['bls_parquet'] = {'status': 'SKIPPED', 'message': 'No BLS changes'}
+    except Exception as e:
+        logger.error("Derived dataset build failed: %s", e, exc_info=True)
+        results['bls_annual'] = results['bls_parquet'] = {'status': 'ERROR', 'error': str(e)}
+    
     # Execute Population ingestion
     if population_api_url:
         try:
             logger.info("Starting population data ingestion...")
             results['population_ingest'] = ingest_population_data(s3_bucket, population_api_url, from_email)
-            logger.info(f"Population ingestion completed: {results['population_ingest']}")
+            logger.info("Population ingestion completed: %s", results['population_ingest'])
         except Exception as e:
-            logger.error(f"Population ingestion failed: {e}", exc_info=True)
+            logger.error("Population ingestion failed: %s", e, exc_info=True)
             results['population_ingest'] = {'status': 'ERROR', 'error': str(e)}
     else:
         logger.warning("POPULATION_API_URL not configured - skipping population ingestion")
@@ -233,7 +725,7 @@ def lambda_handler(event, context):
         results['population_ingest'].get('status') in ['UPDATED', 'SKIPPED']
     )
     
-    logger.info(f"Ingestion pipeline complete: {json.dumps(results, default=str)}")
+    logger.info("Ingestion pipeline complete: %s", json.dumps(results, default=str))
     
     return {
         'statusCode': 200,